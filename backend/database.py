@@ -1,6 +1,7 @@
 import os
 import time
-from typing import Any, Dict, List, Optional
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional
 
 from dotenv import load_dotenv
 
@@ -10,27 +11,103 @@ load_dotenv()
 USE_MONGO = bool(os.getenv("DATABASE_URL")) and bool(os.getenv("DATABASE_NAME"))
 
 if USE_MONGO:
-    from pymongo import MongoClient
-    mongo_client = MongoClient(os.getenv("DATABASE_URL"))
+    from pymongo import MongoClient, UpdateOne
+    # fail fast like the root app instead of pymongo's 30s default
+    mongo_client = MongoClient(os.getenv("DATABASE_URL"), serverSelectionTimeoutMS=2000)
     db = mongo_client[os.getenv("DATABASE_NAME")]
 else:
     mongo_client = None
     db = None
 
+# Fields kept in an inverted index (value -> ordered ids) for point lookups
+INDEXED_FIELDS = ("project_id", "assigned_to")
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
 class MemoryCollection:
     def __init__(self):
         self.data: List[Dict[str, Any]] = []
+        self._by_id: Dict[Any, Dict[str, Any]] = {}
+        # field -> value -> {id: None}; dicts keep insertion order
+        self._index: Dict[str, Dict[Any, Dict[Any, None]]] = {k: {} for k in INDEXED_FIELDS}
+        self._auto = 0
+
+    def _assign_ids(self, docs: List[Dict[str, Any]]):
+        # Like Mongo: fill in a missing _id on the inserted dict and reject duplicates
+        seen = set()
+        for d in docs:
+            if "_id" not in d:
+                self._auto += 1
+                d["_id"] = f"mem_{self._auto}"
+            if d["_id"] in self._by_id or d["_id"] in seen:
+                raise ValueError(f"duplicate _id: {d['_id']!r}")
+            seen.add(d["_id"])
+
+    def _index_add(self, docs: List[Dict[str, Any]]):
+        self._by_id.update((d["_id"], d) for d in docs)
+        # one pass per indexed field; unhashable values stay out of the index
+        # (they can never equal a hashable filter value, and unhashable filters scan)
+        for k, buckets in self._index.items():
+            for d in docs:
+                v = d.get(k)
+                if _hashable(v):
+                    buckets.setdefault(v, {})[d["_id"]] = None
+
+    def _index_move(self, _id: Any, k: str, old: Any, new: Any):
+        if old == new:
+            return
+        buckets = self._index[k]
+        bucket = buckets.get(old) if _hashable(old) else None
+        if bucket is not None:
+            bucket.pop(_id, None)
+            if not bucket:
+                del buckets[old]
+        if _hashable(new):
+            buckets.setdefault(new, {})[_id] = None
+
+    def _snapshot(self):
+        # data is append-only, so bounding iteration to the current length gives
+        # the same view as copying the list without allocating one
+        return islice(self.data, len(self.data))
+
+    def _candidates(self, filter_dict: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        if "_id" in filter_dict and _hashable(filter_dict["_id"]):
+            d = self._by_id.get(filter_dict["_id"])
+            return [d] if d is not None else []
+        buckets = [
+            self._index[k].get(v, {})
+            for k, v in filter_dict.items()
+            if k in self._index and _hashable(v)
+        ]
+        if not buckets:
+            return self._snapshot()
+        buckets.sort(key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return [self._by_id[i] for i in smallest if all(i in b for b in rest)]
 
     def insert_one(self, doc: Dict[str, Any]):
+        self._assign_ids([doc])
         self.data.append(doc)
-        return type("_R", (), {"inserted_id": doc.get("_id")})
+        self._index_add([doc])
+        return type("_R", (), {"inserted_id": doc["_id"]})
+
+    def insert_many(self, docs: List[Dict[str, Any]]):
+        docs = list(docs)
+        self._assign_ids(docs)
+        self.data.extend(docs)
+        self._index_add(docs)
+        return type("_R", (), {"inserted_ids": [d["_id"] for d in docs]})
 
     def find(self, filter_dict: Optional[Dict[str, Any]] = None):
         if not filter_dict:
-            for d in list(self.data):
-                yield d
+            yield from self._snapshot()
             return
-        for d in list(self.data):
+        for d in self._candidates(filter_dict):
             ok = True
             for k, v in filter_dict.items():
                 if d.get(k) != v:
@@ -44,17 +121,37 @@ class MemoryCollection:
             return d
         return None
 
+    def _apply_update(self, doc: Dict[str, Any], update_dict: Dict[str, Any]):
+        if "$set" in update_dict:
+            for k, v in update_dict["$set"].items():
+                if k in self._index:
+                    self._index_move(doc.get("_id"), k, doc.get(k), v)
+                doc[k] = v
+
     def update_one(self, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]):
         doc = self.find_one(filter_dict)
         if not doc:
             return type("_UR", (), {"matched_count": 0, "modified_count": 0})
-        if "$set" in update_dict:
-            for k, v in update_dict["$set"].items():
-                doc[k] = v
+        self._apply_update(doc, update_dict)
         return type("_UR", (), {"matched_count": 1, "modified_count": 1})
 
+    def find_one_and_update(self, filter_dict: Dict[str, Any], update_dict: Dict[str, Any], return_document: bool = False):
+        # return_document=True mirrors pymongo's ReturnDocument.AFTER
+        doc = self.find_one(filter_dict)
+        if not doc:
+            return None
+        before = None if return_document else dict(doc)
+        self._apply_update(doc, update_dict)
+        return doc if return_document else before
+
     def count_documents(self, filter_dict: Optional[Dict[str, Any]] = None):
-        return len(list(self.find(filter_dict)))
+        if not filter_dict:
+            return len(self.data)
+        if len(filter_dict) == 1:
+            (k, v), = filter_dict.items()
+            if k in self._index and _hashable(v):
+                return len(self._index[k].get(v, ()))
+        return sum(1 for _ in self.find(filter_dict))
 
 class MemoryDB:
     def __init__(self):
@@ -79,5 +176,15 @@ def get_collection(name: str):
 
 # Convenience helpers
 
+def bulk_set_by_id(collection, updates: Dict[Any, Dict[str, Any]]):
+    """Apply one `$set` per document id; a single bulk_write round trip on Mongo."""
+    if not updates:
+        return
+    if USE_MONGO:
+        collection.bulk_write([UpdateOne({"_id": _id}, {"$set": fields}) for _id, fields in updates.items()])
+        return
+    for _id, fields in updates.items():
+        collection.update_one({"_id": _id}, {"$set": fields})
+
 def now_ts() -> float:
     return time.time()
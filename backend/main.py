@@ -1,16 +1,39 @@
+import asyncio
+import logging
 import os
 import random
-import string
+import secrets
 import time
-from typing import Any, Dict, List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Set, Tuple
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+import orjson
 from pydantic import BaseModel, Field
 
-from database import get_collection, now_ts
+from database import USE_MONGO, bulk_set_by_id, get_collection, now_ts
 
-app = FastAPI(title="Leadflow API")
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # memory collections index project_id themselves
+    if USE_MONGO:
+        # a missing index only slows queries down; don't let it keep the app from booting
+        try:
+            get_collection("leads").create_index([("project_id", 1), ("assigned_to", 1)])
+            get_collection("users").create_index("project_id")
+        except Exception:
+            logger.exception("could not create Mongo indexes; continuing without them")
+    yield
+
+# same gate as the root app; bootstrap returns orjson bytes directly
+DEFAULT_RESPONSE_CLASS = JSONResponse if getattr(ORJSONResponse, "__deprecated__", None) else ORJSONResponse
+
+app = FastAPI(title="Leadflow API", default_response_class=DEFAULT_RESPONSE_CLASS, lifespan=lifespan)
 
 # CORS: allow all during demo
 app.add_middleware(
@@ -44,37 +67,67 @@ class Project(BaseModel):
     name: str
 
 # ---- Util ----
-STEPS = ["New", "Qualified", "Meeting", "Closed"]
-SOURCES = ["ads", "events", "referral", "inbound"]
-ROLES = ["admin", "setter", "closer"]
+STEPS = ("New", "Qualified", "Meeting", "Closed")
+STEP_INDEX = {s: i for i, s in enumerate(STEPS)}
+SOURCES = ("ads", "events", "referral", "inbound")
+ROLES = ("admin", "setter", "closer")
+
+
+# Bootstrap cache: project_id -> (version, encoded JSON body); lead mutations bump the version
+_BOOTSTRAP_CACHE: Dict[str, Tuple[int, bytes]] = {}
+_CACHE_VERSION: Dict[str, int] = {}
+
+
+def invalidate_bootstrap(project_id: str):
+    _CACHE_VERSION[project_id] = _CACHE_VERSION.get(project_id, 0) + 1
+
+
+# Id suffixes are drawn in blocks: one RNG call per 128 ids
+_ID_BLOCK = 128
+_ID_POOL: Deque[str] = deque()
+
+
+def _refill_ids():
+    raw = secrets.token_hex(5 * _ID_BLOCK)
+    _ID_POOL.extend(raw[i:i + 10] for i in range(0, len(raw), 10))
 
 
 def sid(prefix: str = "") -> str:
-    rand = "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
-    return f"{prefix}{rand}"
+    # handlers run in a threadpool, so empty-check + pop isn't atomic; refill on miss
+    while True:
+        try:
+            return prefix + _ID_POOL.popleft()
+        except IndexError:
+            _refill_ids()
 
 
 # ---- WebSocket manager ----
 class ConnectionManager:
     def __init__(self):
-        self.rooms: Dict[str, List[WebSocket]] = {}
+        self.rooms: Dict[str, Set[WebSocket]] = {}
 
     async def connect(self, project_id: str, websocket: WebSocket):
         await websocket.accept()
-        self.rooms.setdefault(project_id, []).append(websocket)
+        self.rooms.setdefault(project_id, set()).add(websocket)
 
     def disconnect(self, project_id: str, websocket: WebSocket):
-        if project_id in self.rooms and websocket in self.rooms[project_id]:
-            self.rooms[project_id].remove(websocket)
+        room = self.rooms.get(project_id)
+        if room is not None:
+            room.discard(websocket)
+            if not room:
+                del self.rooms[project_id]
 
     async def emit(self, project_id: str, event: str, payload: Dict[str, Any]):
-        if project_id not in self.rooms:
+        # snapshot: sockets may connect/disconnect while the sends are awaited
+        conns = tuple(self.rooms.get(project_id, ()))
+        if not conns:
             return
-        for ws in list(self.rooms[project_id]):
-            try:
-                await ws.send_json({"type": event, "data": payload})
-            except Exception:
-                pass
+        # Encode once, send concurrently; sockets whose send failed are dropped
+        text = orjson.dumps({"type": event, "data": payload}).decode()
+        results = await asyncio.gather(*(ws.send_text(text) for ws in conns), return_exceptions=True)
+        for ws, result in zip(conns, results):
+            if isinstance(result, Exception):
+                self.disconnect(project_id, ws)
 
 manager = ConnectionManager()
 
@@ -98,40 +151,55 @@ def bootstrap():
         proj = {"_id": sid("proj_"), "name": "Leadflow Demo"}
         projects.insert_one(proj)
 
+    ver = _CACHE_VERSION.get(proj["_id"], 0)
+    cached = _BOOTSTRAP_CACHE.get(proj["_id"])
+    if cached and cached[0] == ver:
+        return Response(cached[1], media_type="application/json")
+
     # create users if missing
     existing_users = list(users.find({"project_id": proj["_id"]}))
     if not existing_users:
-        for i, role in enumerate(["admin", "setter", "setter", "closer"]):
-            users.insert_one({
+        users.insert_many([
+            {
                 "_id": sid("usr_"),
                 "project_id": proj["_id"],
-                "name": ["Ava", "Ben", "Chloe", "Diego"][i],
+                "name": name,
                 "role": role,
-            })
+            }
+            for name, role in zip(["Ava", "Ben", "Chloe", "Diego"], ["admin", "setter", "setter", "closer"])
+        ])
         existing_users = list(users.find({"project_id": proj["_id"]}))
 
     # create ~120 leads if missing
     existing_lead_count = leads.count_documents({"project_id": proj["_id"]})
     if existing_lead_count < 100:
-        for i in range(120):
-            leads.insert_one({
+        now = time.time()
+        steps = random.choices(STEPS, k=120)
+        sources = random.choices(SOURCES, k=120)
+        leads.insert_many([
+            {
                 "_id": sid("lead_"),
                 "project_id": proj["_id"],
                 "name": f"Lead {i+1}",
                 "email": f"lead{i+1}@example.com",
-                "step": random.choice(STEPS),
-                "source": random.choice(SOURCES),
+                "step": step,
+                "source": source,
                 "assigned_to": None,
-                "created_at": time.time(),
-                "updated_at": time.time(),
-            })
+                "created_at": now,
+                "updated_at": now,
+            }
+            for i, (step, source) in enumerate(zip(steps, sources))
+        ])
 
-    return {
+    payload = {
         "project": proj,
         "steps": STEPS,
         "users": list(users.find({"project_id": proj["_id"]})),
         "leads": list(leads.find({"project_id": proj["_id"]})),
     }
+    body = orjson.dumps(payload)
+    _BOOTSTRAP_CACHE[proj["_id"]] = (ver, body)
+    return Response(body, media_type="application/json")
 
 class AdvanceRequest(BaseModel):
     lead_id: str
@@ -142,10 +210,15 @@ def advance(req: AdvanceRequest):
     lead = leads.find_one({"_id": req.lead_id})
     if not lead:
         return {"ok": False, "error": "lead_not_found"}
-    idx = STEPS.index(lead["step"]) if lead["step"] in STEPS else 0
+    idx = STEP_INDEX.get(lead["step"], 0)
     idx = min(idx + 1, len(STEPS) - 1)
-    lead["step"] = STEPS[idx]
-    lead["updated_at"] = time.time()
+    # write through the collection; mutating the fetched dict is lost on Mongo
+    lead = leads.find_one_and_update(
+        {"_id": req.lead_id},
+        {"$set": {"step": STEPS[idx], "updated_at": time.time()}},
+        return_document=True,
+    )
+    invalidate_bootstrap(lead["project_id"])
     return {"ok": True, "lead": lead}
 
 class AssignRequest(BaseModel):
@@ -155,11 +228,14 @@ class AssignRequest(BaseModel):
 @app.post("/api/assign")
 def assign(req: AssignRequest):
     leads = get_collection("leads")
-    lead = leads.find_one({"_id": req.lead_id})
+    lead = leads.find_one_and_update(
+        {"_id": req.lead_id},
+        {"$set": {"assigned_to": req.user_id, "updated_at": time.time()}},
+        return_document=True,
+    )
     if not lead:
         return {"ok": False, "error": "lead_not_found"}
-    lead["assigned_to"] = req.user_id
-    lead["updated_at"] = time.time()
+    invalidate_bootstrap(lead["project_id"])
     return {"ok": True, "lead": lead}
 
 @app.post("/api/advance-random")
@@ -169,13 +245,21 @@ def advance_random():
     if not all_leads:
         return {"ok": False, "count": 0}
     changed = 0
+    now = time.time()
+    # lead id -> pending $set; a lead picked twice advances from its pending step
+    updates: Dict[str, Dict[str, Any]] = {}
+    touched: Set[str] = set()
     for _ in range(random.randint(1, 4)):
         lead = random.choice(all_leads)
-        idx = STEPS.index(lead["step"]) if lead["step"] in STEPS else 0
+        idx = STEP_INDEX.get(updates.get(lead["_id"], lead)["step"], 0)
         if idx < len(STEPS) - 1:
-            lead["step"] = STEPS[idx + 1]
-            lead["updated_at"] = time.time()
+            updates[lead["_id"]] = {"step": STEPS[idx + 1], "updated_at": now}
+            touched.add(lead["project_id"])
             changed += 1
+    bulk_set_by_id(leads, updates)
+    # invalidate only after the write so a concurrent bootstrap can't cache pre-write data
+    for project_id in touched:
+        invalidate_bootstrap(project_id)
     return {"ok": True, "count": changed}
 
 # WebSocket
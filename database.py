@@ -3,12 +3,13 @@ Database Helper Functions with In-Memory Fallback
 
 Uses MongoDB when DATABASE_URL and DATABASE_NAME are provided.
 If not available, falls back to an in-memory store that mimics the subset of
-PyMongo APIs used by the app (find, find_one, insert_one, update_one, list_collection_names).
+PyMongo APIs used by the app (find, find_one, insert_one, insert_many, update_one,
+find_one_and_update, list_collection_names).
 """
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterator, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 import os
 
 from dotenv import load_dotenv
@@ -17,16 +18,16 @@ from pydantic import BaseModel
 # Load env
 load_dotenv()
 
-# Try Mongo first
-from pymongo import MongoClient
-
 _client = None
 _db = None
 
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+# Try Mongo first; pymongo is only imported when it is configured
 if database_url and database_name:
+    from pymongo import MongoClient
+
     try:
         _client = MongoClient(database_url, serverSelectionTimeoutMS=2000)
         # Trigger a server selection to fail fast if not reachable
@@ -45,48 +46,133 @@ class _InsertOneResult:
         self.inserted_id = inserted_id
 
 
+class _InsertManyResult:
+    def __init__(self, inserted_ids: List[str]):
+        self.inserted_ids = inserted_ids
+
+
+# Fields kept in an inverted index (value -> ordered ids) for point lookups
+_INDEXED_FIELDS = ("project_id", "assigned_to")
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
 class MemoryCollection:
     def __init__(self, name: str, store: Dict[str, Dict[str, Any]]):
         self.name = name
         self.store = store  # id -> doc
         self._auto = 0
+        # field -> value -> {id: None}; dicts keep insertion order so results stay stable
+        self._index: Dict[str, Dict[Any, Dict[str, None]]] = {k: {} for k in _INDEXED_FIELDS}
 
     def _gen_id(self) -> str:
         self._auto += 1
         return f"mem_{self.name}_{self._auto}"
 
-    def find(self, filter_dict: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    def _index_add(self, docs: List[Dict[str, Any]]) -> None:
+        # One pass per indexed field. Unhashable values are left out: they can never
+        # equal a hashable filter value, and unhashable filter values fall back to a scan.
+        for k, buckets in self._index.items():
+            for doc in docs:
+                value = doc.get(k)
+                if _hashable(value):
+                    buckets.setdefault(value, {})[doc["_id"]] = None
+
+    def _index_move(self, _id: str, k: str, old: Any, new: Any) -> None:
+        if old == new:
+            return
+        buckets = self._index[k]
+        bucket = buckets.get(old) if _hashable(old) else None
+        if bucket is not None:
+            bucket.pop(_id, None)
+            if not bucket:
+                del buckets[old]
+        if _hashable(new):
+            buckets.setdefault(new, {})[_id] = None
+
+    def _candidates(self, filter_dict: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """Narrow the docs to scan using the `_id` key and the inverted indexes."""
+        _id = filter_dict.get("_id")
+        if _id is not None and _hashable(_id):
+            doc = self.store.get(_id)
+            return (doc,) if doc is not None else ()
+        buckets = [
+            self._index[k].get(v, {})
+            for k, v in filter_dict.items()
+            if k in self._index and _hashable(v)
+        ]
+        if not buckets:
+            return list(self.store.values())
+        buckets.sort(key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return [self.store[i] for i in smallest if all(i in b for b in rest)]
+
+    def find(self, filter_dict: Optional[Dict[str, Any]] = None, rename_id: bool = False) -> Iterator[Dict[str, Any]]:
+        """Yield copies of matching docs; with rename_id, `_id` becomes a string `id` in the same copy."""
         filter_dict = filter_dict or {}
-        for doc in list(self.store.values()):
-            if _match_filter(doc, filter_dict):
-                yield dict(doc)
+        matches = _compile_filter(filter_dict)
+        for doc in self._candidates(filter_dict):
+            if matches(doc):
+                if rename_id:
+                    out = {k: v for k, v in doc.items() if k != "_id"}
+                    out["id"] = str(doc["_id"])
+                    yield out
+                else:
+                    yield dict(doc)
 
     def find_one(self, filter_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # find already yields a copy
         for doc in self.find(filter_dict):
-            return dict(doc)
+            return doc
         return None
 
     def insert_one(self, data: Dict[str, Any]) -> _InsertOneResult:
-        _id = self._gen_id()
-        to_insert = dict(data)
-        to_insert["_id"] = _id
-        self.store[_id] = to_insert
-        return _InsertOneResult(_id)
-
-    def update_one(self, filter_dict: Dict[str, Any], update_doc: Dict[str, Any]):
+        return _InsertOneResult(self.insert_many([data]).inserted_ids[0])
+
+    def insert_many(self, documents: Iterable[Dict[str, Any]]) -> _InsertManyResult:
+        to_insert = []
+        for data in documents:
+            doc = dict(data)
+            doc["_id"] = self._gen_id()
+            to_insert.append(doc)
+        self._index_add(to_insert)
+        self.store.update((doc["_id"], doc) for doc in to_insert)
+        return _InsertManyResult([doc["_id"] for doc in to_insert])
+
+    def _apply_update(self, current: Dict[str, Any], update_doc: Dict[str, Any]) -> None:
         # Very small subset: supports $set and $push
-        doc = self.find_one(filter_dict)
-        if not doc:
-            return
-        current = self.store[doc["_id"]]
         if "$set" in update_doc:
             for k, v in update_doc["$set"].items():
+                if k in self._index:
+                    self._index_move(current["_id"], k, current.get(k), v)
                 current[k] = v
         if "$push" in update_doc:
             for k, v in update_doc["$push"].items():
                 current.setdefault(k, [])
                 current[k].append(v)
-        self.store[doc["_id"]] = current
+
+    def update_one(self, filter_dict: Dict[str, Any], update_doc: Dict[str, Any]):
+        doc = self.find_one(filter_dict)
+        if not doc:
+            return
+        self._apply_update(self.store[doc["_id"]], update_doc)
+
+    def find_one_and_update(
+        self, filter_dict: Dict[str, Any], update_doc: Dict[str, Any], return_document: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """Update the first match and return it; `return_document=True` (ReturnDocument.AFTER) returns it post-update."""
+        doc = self.find_one(filter_dict)
+        if not doc:
+            return None
+        current = self.store[doc["_id"]]
+        self._apply_update(current, update_doc)
+        return dict(current) if return_document else doc
 
 
 class MemoryDB:
@@ -105,15 +191,45 @@ class MemoryDB:
         return list(self._collections.keys())
 
 
-def _match_filter(doc: Dict[str, Any], filt: Dict[str, Any]) -> bool:
+def _compile_filter(filt: Dict[str, Any]) -> Callable[[Dict[str, Any]], bool]:
+    """Turn a filter into a predicate once per query, so the per-document
+    work is only the comparisons themselves."""
+    equals = []
+    members = []
     for k, v in filt.items():
         if isinstance(v, dict) and "$in" in v:
-            if doc.get(k) not in v["$in"]:
-                return False
+            values = list(v["$in"])
+            try:
+                lookup = frozenset(values)
+            except TypeError:
+                lookup = values  # unhashable members: linear membership test
+            members.append((k, lookup, values))
         else:
-            if doc.get(k) != v:
+            equals.append((k, v))
+    if not members:
+        if not equals:
+            return lambda doc: True
+        if len(equals) == 1:
+            (k, v), = equals
+            return lambda doc: doc.get(k) == v
+    equals_t, members_t = tuple(equals), tuple(members)
+
+    def matches(doc: Dict[str, Any]) -> bool:
+        get = doc.get
+        for k, v in equals_t:
+            if get(k) != v:
                 return False
-    return True
+        for k, lookup, values in members_t:
+            value = get(k)
+            try:
+                found = value in lookup
+            except TypeError:
+                found = value in values  # unhashable doc value (e.g. a list field)
+            if not found:
+                return False
+        return True
+
+    return matches
 
 
 # Exposed handle: either real Mongo DB or memory DB
@@ -127,13 +243,14 @@ else:
 # Helper functions (work for both backends)
 # ---------------------------
 
-def create_document(collection_name: str, data: Union[BaseModel, dict]) -> str:
+def create_document(collection_name: str, data: Union[BaseModel, dict], now: Optional[datetime] = None) -> str:
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
     else:
         data_dict = dict(data)
 
-    now = datetime.now(timezone.utc)
+    # Callers seeding several documents can pass a shared timestamp
+    now = now or datetime.now(timezone.utc)
     data_dict.setdefault("created_at", now)
     data_dict["updated_at"] = now
 
@@ -141,9 +258,38 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]) -> str:
     return str(result.inserted_id)
 
 
+def create_documents(
+    collection_name: str, items: List[Union[BaseModel, dict]], now: Optional[datetime] = None
+) -> List[str]:
+    """Insert several documents in one round trip, sharing a single timestamp."""
+    if not items:
+        return []
+    now = now or datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else dict(data)
+        data_dict.setdefault("created_at", now)
+        data_dict["updated_at"] = now
+        docs.append(data_dict)
+
+    result = db[collection_name].insert_many(docs)
+    return [str(i) for i in result.inserted_ids]
+
+
 def get_documents(collection_name: str, filter_dict: Optional[dict] = None, limit: Optional[int] = None) -> List[dict]:
     cursor = db[collection_name].find(filter_dict or {})
     docs = list(cursor)
     if limit:
         docs = docs[:limit]
     return docs
+
+
+def get_documents_with_id(collection_name: str, filter_dict: Optional[dict] = None) -> List[dict]:
+    """Like get_documents, but with `_id` exposed as a string `id` field for API responses."""
+    collection = db[collection_name]
+    if isinstance(collection, MemoryCollection):
+        return list(collection.find(filter_dict or {}, rename_id=True))
+    docs = list(collection.find(filter_dict or {}))
+    for d in docs:
+        d["id"] = str(d.pop("_id"))
+    return docs
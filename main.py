@@ -1,15 +1,41 @@
+import asyncio
 import os
 import random
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+import orjson
 from pydantic import BaseModel
 
-from database import db, create_document, get_documents
+from database import MemoryDB, db, create_document, create_documents, get_documents, get_documents_with_id
 
-app = FastAPI(title="Leadflow API")
+# The memory backend stores plain string ids, so bson is only loaded for Mongo
+_IS_MONGO = not isinstance(db, MemoryDB)
+if _IS_MONGO:
+    from bson import ObjectId  # type: ignore
+    from bson.errors import InvalidId  # type: ignore
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The memory backend keeps its own inverted indexes; Mongo needs real ones
+    if _IS_MONGO:
+        db["lead"].create_index([("project_id", 1), ("assigned_to", 1)])
+        db["lead"].create_index([("project_id", 1), ("current_step", 1)])
+    yield
+
+
+# ORJSONResponse only replaces the final dump; routes still go through jsonable_encoder.
+# Newer FastAPI deprecates it, so fall back to the stock class there. Hot routes
+# (bootstrap) bypass both by returning pre-encoded orjson bytes.
+DEFAULT_RESPONSE_CLASS = JSONResponse if getattr(ORJSONResponse, "__deprecated__", None) else ORJSONResponse
+
+
+app = FastAPI(title="Leadflow API", default_response_class=DEFAULT_RESPONSE_CLASS, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,24 +51,29 @@ app.add_middleware(
 # ---------------------------
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
 
     async def connect(self, project_id: str, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.setdefault(project_id, []).append(websocket)
+        self.active_connections.setdefault(project_id, set()).add(websocket)
 
     def disconnect(self, project_id: str, websocket: WebSocket):
-        if project_id in self.active_connections:
-            try:
-                self.active_connections[project_id].remove(websocket)
-            except ValueError:
-                pass
+        connections = self.active_connections.get(project_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del self.active_connections[project_id]
 
     async def broadcast(self, project_id: str, message: dict):
-        for ws in list(self.active_connections.get(project_id, [])):
-            try:
-                await ws.send_json(message)
-            except Exception:
+        # Snapshot, since sockets may come and go while sends are awaited
+        connections = tuple(self.active_connections.get(project_id, ()))
+        if not connections:
+            return
+        # Encode once and send to every socket concurrently
+        text = orjson.dumps(message).decode()
+        results = await asyncio.gather(*(ws.send_text(text) for ws in connections), return_exceptions=True)
+        for ws, result in zip(connections, results):
+            if isinstance(result, Exception):
                 # Best-effort cleanup if send fails
                 self.disconnect(project_id, ws)
 
@@ -55,16 +86,36 @@ manager = ConnectionManager()
 # ---------------------------
 
 
+# Bootstrap payload cache: project_id -> (version, encoded JSON body).
+# Any lead mutation bumps the project's version, so stale entries are simply rebuilt.
+_BOOTSTRAP_CACHE: Dict[str, Tuple[int, bytes]] = {}
+_CACHE_VERSION: Dict[str, int] = {}
+
+
+def invalidate_bootstrap(project_id) -> None:
+    key = str(project_id)
+    _CACHE_VERSION[key] = _CACHE_VERSION.get(key, 0) + 1
+
+
 def to_obj_id(id_str: str):
+    if not _IS_MONGO:
+        return id_str
     try:
-        # Memory IDs pass-through; Mongo IDs should be valid ObjectId
-        from bson import ObjectId  # type: ignore
         return ObjectId(id_str)
-    except Exception:
-        # In-memory fallback uses string IDs; just return the string for filters
+    except (InvalidId, TypeError):
+        # Not an ObjectId; documents seeded with string ids are matched as-is
         return id_str
 
 
+def find_by_id(collection_name: str, id_str: str) -> Optional[dict]:
+    """Look a document up by id, trying the ObjectId form first on Mongo."""
+    oid = to_obj_id(id_str)
+    doc = db[collection_name].find_one({"_id": oid})
+    if doc is None and oid is not id_str:
+        doc = db[collection_name].find_one({"_id": id_str})
+    return doc
+
+
 # ---------------------------
 # Health + Test endpoints
 # ---------------------------
@@ -122,8 +173,10 @@ def ensure_demo_project() -> str:
         return str(project.get("_id"))
 
     steps = ["Acquisition", "Setter", "Closer", "Vente"]
+    # One clock read for the whole seed; every document shares the timestamp
+    now = datetime.now(timezone.utc)
     project_id = create_document(
-        "project", {"name": "Leadflow Demo", "steps": steps, "members": [], "created_at": datetime.now(timezone.utc)}
+        "project", {"name": "Leadflow Demo", "steps": steps, "members": [], "created_at": now}, now=now
     )
 
     # Create users
@@ -133,10 +186,7 @@ def ensure_demo_project() -> str:
         {"name": "Casey Closer", "email": "closer@leadflow.app", "role": "closer"},
         {"name": "Vera Viewer", "email": "viewer@leadflow.app", "role": "viewer"},
     ]
-    user_ids: List[str] = []
-    for u in users:
-        uid = create_document("user", {**u, "permissions": [], "leads_assignes": []})
-        user_ids.append(uid)
+    user_ids = create_documents("user", [{**u, "permissions": [], "leads_assignes": []} for u in users], now=now)
 
     # Generate random leads (~120)
     first_names = [
@@ -162,18 +212,21 @@ def ensure_demo_project() -> str:
         "Louis",
     ]
     sources = ["Ads", "Referral", "Website", "Outbound", "Event"]
-    for i in range(120):
-        name = random.choice(first_names) + f" {random.randint(100,999)}"
-        step_index = random.choices([0, 1, 2, 3], weights=[5, 4, 3, 2])[0]
-        current_step = steps[step_index]
-        assigned = random.choice(user_ids[1:3]) if step_index >= 1 else None
-        lead = {
-            "name": name,
-            "source": random.choice(sources),
-            "entered_at": datetime.now(timezone.utc),
+    # Draw every random column in one batch, then build all leads in a single pass
+    count = 120
+    step_indexes = random.choices(range(len(steps)), weights=[5, 4, 3, 2], k=count)
+    names = random.choices(first_names, k=count)
+    numbers = random.choices(range(100, 1000), k=count)
+    lead_sources = random.choices(sources, k=count)
+    setters = random.choices(user_ids[1:3], k=count)
+    leads = [
+        {
+            "name": f"{first} {number}",
+            "source": source,
+            "entered_at": now,
             "project_id": project_id,
-            "current_step": current_step,
-            "assigned_to": assigned,
+            "current_step": steps[step_index],
+            "assigned_to": setter if step_index >= 1 else None,
             "status": "active",
             "notes": [],
             "appointments": [],
@@ -182,37 +235,44 @@ def ensure_demo_project() -> str:
                     "project_id": project_id,
                     "lead_id": "",
                     "type": "created",
-                    "to_step": current_step,
-                    "created_at": datetime.now(timezone.utc),
+                    "to_step": steps[step_index],
+                    "created_at": now,
                 }
             ],
         }
-        create_document("lead", lead)
+        for step_index, first, number, source, setter in zip(step_indexes, names, numbers, lead_sources, setters)
+    ]
+    create_documents("lead", leads, now=now)
 
     # Attach members to project
     # Works for both memory and mongo ids
-    db["project"].update_one({"_id": project_id}, {"$set": {"members": user_ids}})
+    db["project"].update_one({"_id": to_obj_id(project_id)}, {"$set": {"members": user_ids}})
 
     return project_id
 
 
+# Returning a Response skips response_model validation; the model still documents the shape
 @app.get("/api/demo/bootstrap", response_model=DemoBootstrapResponse)
 def demo_bootstrap():
     project_id = ensure_demo_project()
-    project = db["project"].find_one({"_id": project_id}) or db["project"].find_one({"_id": to_obj_id(project_id)})
+    ver = _CACHE_VERSION.get(project_id, 0)
+    cached = _BOOTSTRAP_CACHE.get(project_id)
+    if cached and cached[0] == ver:
+        return Response(cached[1], media_type="application/json")
+
+    project = find_by_id("project", project_id)
     steps: List[str] = project.get("steps", []) if project else ["Acquisition", "Setter", "Closer", "Vente"]
-    users = list(db["user"].find({}))
-    for u in users:
-        u["id"] = str(u.pop("_id"))
-    leads = list(db["lead"].find({"project_id": project_id}))
-    for l in leads:
-        l["id"] = str(l.pop("_id"))
-    return {
+    users = get_documents_with_id("user")
+    leads = get_documents_with_id("lead", {"project_id": project_id})
+    payload = {
         "project_id": project_id,
         "steps": steps,
         "users": users,
         "leads": leads,
     }
+    body = orjson.dumps(payload)
+    _BOOTSTRAP_CACHE[project_id] = (ver, body)
+    return Response(body, media_type="application/json")
 
 
 # ---------------------------
@@ -220,15 +280,12 @@ def demo_bootstrap():
 # ---------------------------
 @app.get("/api/projects")
 def list_projects():
-    projects = list(db["project"].find())
-    for p in projects:
-        p["id"] = str(p.pop("_id"))
-    return projects
+    return get_documents_with_id("project")
 
 
 @app.get("/api/projects/{project_id}")
 def get_project(project_id: str):
-    project = db["project"].find_one({"_id": project_id}) or db["project"].find_one({"_id": to_obj_id(project_id)})
+    project = find_by_id("project", project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     project["id"] = str(project.pop("_id"))
@@ -239,15 +296,12 @@ def get_project(project_id: str):
 def list_users(project_id: Optional[str] = None):
     query: Dict = {}
     if project_id:
-        project = db["project"].find_one({"_id": project_id}) or db["project"].find_one({"_id": to_obj_id(project_id)})
+        project = find_by_id("project", project_id)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         member_ids = project.get("members", [])
         query = {"_id": {"$in": member_ids}}
-    users = list(db["user"].find(query))
-    for u in users:
-        u["id"] = str(u.pop("_id"))
-    return users
+    return get_documents_with_id("user", query)
 
 
 @app.get("/api/leads")
@@ -257,15 +311,12 @@ def get_leads(project_id: Optional[str] = None, assigned_to: Optional[str] = Non
         query["project_id"] = project_id
     if assigned_to:
         query["assigned_to"] = assigned_to
-    leads = list(db["lead"].find(query))
-    for l in leads:
-        l["id"] = str(l.pop("_id"))
-    return leads
+    return get_documents_with_id("lead", query)
 
 
 @app.get("/api/leads/{lead_id}")
 def get_lead(lead_id: str):
-    lead = db["lead"].find_one({"_id": lead_id}) or db["lead"].find_one({"_id": to_obj_id(lead_id)})
+    lead = find_by_id("lead", lead_id)
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
     lead["id"] = str(lead.pop("_id"))
@@ -278,34 +329,39 @@ class AdvanceRequest(BaseModel):
 
 @app.post("/api/leads/{lead_id}/advance")
 async def advance_lead(lead_id: str, payload: AdvanceRequest):
-    lead = db["lead"].find_one({"_id": lead_id}) or db["lead"].find_one({"_id": to_obj_id(lead_id)})
+    lead = find_by_id("lead", lead_id)
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
 
     project_id = lead.get("project_id")
-    project = db["project"].find_one({"_id": project_id}) if project_id else None
+    project = find_by_id("project", str(project_id)) if project_id else None
     if not project:
         raise HTTPException(status_code=400, detail="Project not found for lead")
     steps = project.get("steps", [])
 
+    # Steps are per project; build the position map once and reuse it for both lookups
+    step_index = {s: i for i, s in enumerate(steps)}
+
     current_step = lead.get("current_step")
-    if payload.to_step and payload.to_step in steps:
+    if payload.to_step and payload.to_step in step_index:
         new_step = payload.to_step
     else:
-        try:
-            idx = steps.index(current_step)
+        idx = step_index.get(current_step)
+        if idx is not None:
             new_step = steps[min(idx + 1, len(steps) - 1)]
-        except ValueError:
+        else:
             new_step = steps[0] if steps else current_step
 
     status = lead.get("status", "active")
     if new_step == steps[-1]:
         status = "won"
 
-    db["lead"].update_one(
-        {"_id": lead_id},
+    now = datetime.now(timezone.utc)
+    # Update and re-read in one round trip; return_document=True is ReturnDocument.AFTER
+    updated = db["lead"].find_one_and_update(
+        {"_id": lead["_id"]},
         {
-            "$set": {"current_step": new_step, "status": status, "updated_at": datetime.now(timezone.utc)},
+            "$set": {"current_step": new_step, "status": status, "updated_at": now},
             "$push": {
                 "history": {
                     "project_id": project_id,
@@ -313,19 +369,21 @@ async def advance_lead(lead_id: str, payload: AdvanceRequest):
                     "type": "advanced",
                     "from_step": current_step,
                     "to_step": new_step,
-                    "created_at": datetime.now(timezone.utc),
+                    "created_at": now,
                 }
             },
         },
+        return_document=True,
     )
 
+    invalidate_bootstrap(project_id)
+
     # Broadcast event
     await manager.broadcast(
         str(project_id),
         {"type": "lead_advanced", "lead_id": lead_id, "from": current_step, "to": new_step},
     )
 
-    updated = db["lead"].find_one({"_id": lead_id}) or db["lead"].find_one({"_id": to_obj_id(lead_id)})
     updated["id"] = str(updated.pop("_id"))
     return updated
 
@@ -336,7 +394,7 @@ class AssignRequest(BaseModel):
 
 @app.post("/api/leads/{lead_id}/assign")
 async def assign_lead(lead_id: str, payload: AssignRequest):
-    lead = db["lead"].find_one({"_id": lead_id}) or db["lead"].find_one({"_id": to_obj_id(lead_id)})
+    lead = find_by_id("lead", lead_id)
     if not lead:
         raise HTTPException(status_code=404, detail="Lead not found")
 
@@ -346,32 +404,36 @@ async def assign_lead(lead_id: str, payload: AssignRequest):
 
     user_id = payload.user_id
     if user_id is not None:
-        user = db["user"].find_one({"_id": user_id}) or db["user"].find_one({"_id": to_obj_id(user_id)})
+        user = find_by_id("user", user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-    db["lead"].update_one(
-        {"_id": lead_id},
+    now = datetime.now(timezone.utc)
+    # Update and re-read in one round trip
+    updated = db["lead"].find_one_and_update(
+        {"_id": lead["_id"]},
         {
-            "$set": {"assigned_to": user_id, "updated_at": datetime.now(timezone.utc)},
+            "$set": {"assigned_to": user_id, "updated_at": now},
             "$push": {
                 "history": {
                     "project_id": project_id,
                     "lead_id": lead_id,
                     "type": "assigned",
                     "to_user": user_id,
-                    "created_at": datetime.now(timezone.utc),
+                    "created_at": now,
                 }
             },
         },
+        return_document=True,
     )
 
+    invalidate_bootstrap(project_id)
+
     await manager.broadcast(
         project_id,
         {"type": "lead_assigned", "lead_id": lead_id, "to_user": user_id},
     )
 
-    updated = db["lead"].find_one({"_id": lead_id}) or db["lead"].find_one({"_id": to_obj_id(lead_id)})
     updated["id"] = str(updated.pop("_id"))
     return updated
 